@@ -1,11 +1,19 @@
+import asyncio
 from functools import lru_cache
-import json
+import hashlib
+import heapq
+import httpx
 import os
 import logging
 import re
-from flask import Flask, request, jsonify, send_from_directory
-from tenacity import retry, wait_exponential, stop_after_attempt
-from openai import OpenAI
+from typing import Optional
+import numpy as np
+import orjson
+import diskcache
+import msgspec
+from sentence_transformers import SentenceTransformer
+from quart import Quart, Response, request, jsonify, send_from_directory
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from openai import OpenAIError
 
 logging.basicConfig(level=logging.INFO)
@@ -13,62 +21,291 @@ logger = logging.getLogger(__name__)
 
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
 OPENROUTER_MODEL = "meta-llama/llama-3.3-8b-instruct:free"
+# Details are structured knowledge recall, so a smaller, faster model is enough
+OPENROUTER_DETAILS_MODEL = os.getenv('OPENROUTER_DETAILS_MODEL', "meta-llama/llama-3.2-3b-instruct:free")
+OPENROUTER_MAX_CONCURRENCY = 8
+DIAGNOSIS_MAX_TOKENS = 700
+DETAILS_MAX_TOKENS = 800
+# JSON mode makes the find_json_block fallback in extract_json a defensive path only
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+BATCH_MAX_CASES = 50
+JSON_TOKEN_RE = re.compile(r'[{}"\\]')
+PROMPT_HEADER = """You are an expert veterinary diagnostic AI. Rank possible diagnoses for this pet with likelihood (%), explanation, urgency, consultation advice and home care, based on:
+"""
+PROMPT_FOOTER = """
+Return only a JSON object, no other text or code blocks, with fields: conditions (list of {name, likelihood, explanation}), urgent (bool), consult (str), homecare (str).
+"""
+DISCLAIMER = "This is not veterinary advice. Please consult a licensed veterinarian for accurate diagnosis and treatment."
+
+CACHE_DIR = os.getenv('VETCHECK_CACHE_DIR', 'data')
+SEMANTIC_CACHE_MODEL = "all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+# Most recent diagnoses kept per exact-match partition (species, breed, sex, age)
+SEMANTIC_CACHE_MAX_ENTRIES = 64
+CASE_EXACT_FIELDS = ('species', 'breed', 'sex', 'age')
+CASE_FREE_TEXT_FIELDS = ('symptoms', 'medical_history', 'other_info')
+DETAILS_CACHE_EXPIRE = 30 * 86400
+
+STATIC_MAX_AGE = 3600
+VERSIONED_ASSET_MAX_AGE = 31536000
+
+app = Quart(__name__, static_folder='.', static_url_path='')
+
+# Created on first use so each worker process gets its own HTTP/2 connection pool
+@lru_cache(maxsize=1)
+def get_client():
+    return AsyncOpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=OPENROUTER_API_KEY,
+        http_client=DefaultAsyncHttpxClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        )
+    )
 
-app = Flask(__name__, static_folder='.', static_url_path='')
+# Bounds concurrent OpenRouter calls per worker; created in before_serving so it binds to the serving loop
+openrouter_semaphore = None
 
-# Initialize OpenAI client for OpenRouter
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=OPENROUTER_API_KEY
-)
+@app.before_serving
+async def init_openrouter_semaphore():
+    global openrouter_semaphore
+    openrouter_semaphore = asyncio.Semaphore(OPENROUTER_MAX_CONCURRENCY)
 
 @app.after_request
-def add_noindex_header(response):
+async def add_noindex_header(response):
     response.headers['X-Robots-Tag'] = 'noindex'
     return response 
 
-def create_prompt(user_data):
-    prompt = """You are an expert veterinary diagnostic AI. Provide a JSON response with ranked possible diagnoses for this pet, their likelihood (%), explanation, urgency (true/false), veterinary consultation advice, and home care suggestions based on this data:
-"""
-    for key, value in user_data.items():
-        prompt += f"{key.capitalize()}: {value}\n"
-    prompt += """
-Return a valid JSON object with fields: conditions (list of {name, likelihood, explanation}), urgent (bool), consult (str), homecare (str). Focus on common conditions for the specified species and breed. Ensure the response is strictly JSON, with no additional text or code blocks.
-"""
-    return prompt
+# Frozen so a decoded case is hashable and can key the create_prompt cache directly
+class CaseInput(msgspec.Struct, frozen=True, kw_only=True):
+    species: str
+    breed: str = "Mixed"
+    age: Optional[str] = None
+    sex: Optional[str] = None
+    medical_history: Optional[str] = None
+    symptoms: str
+    other_info: Optional[str] = None
+
+@lru_cache(maxsize=256)
+def create_prompt(case):
+    case_lines = "\n".join(
+        f"{field[:1].upper()}{field[1:]}: {getattr(case, field)}"
+        for field in case.__struct_fields__
+        if getattr(case, field)
+    )
+    return PROMPT_HEADER + case_lines + PROMPT_FOOTER
+
+async def retrying(create_call, attempts=2):
+    # Each attempt holds an openrouter_semaphore slot; the backoff sleep between attempts does not
+    for attempt in range(attempts):
+        try:
+            async with openrouter_semaphore:
+                return await create_call()
+        except OpenAIError:
+            if attempt == attempts - 1:
+                raise
+            await asyncio.sleep(min(5, 2 * 2 ** attempt))
 
-@retry(wait=wait_exponential(multiplier=1, min=2, max=5), stop=stop_after_attempt(2))
-def query_openrouter(prompt):
+async def query_openrouter(prompt):
     try:
-        response = client.chat.completions.create(
+        return await retrying(lambda: get_client().chat.completions.create(
             model=OPENROUTER_MODEL,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.15
-        )
-        return response
+            temperature=0.15,
+            max_tokens=DIAGNOSIS_MAX_TOKENS,
+            response_format=JSON_RESPONSE_FORMAT
+        ))
     except OpenAIError as e:
         if getattr(e, 'status_code', None) == 503:
-            logger.warning(f"OpenRouter 503 error: {str(e)}")
+            logger.warning("OpenRouter 503 error: %s", e)
             raise Exception("Model temporarily unavailable. Please try again later.")
-        logger.error(f"OpenRouter API error: {str(e)}")
+        logger.error("OpenRouter API error: %s", e)
         raise
 
-def process_response(response):
-    content = response.choices[0].message.content
-    logger.info(f"Raw OpenRouter response: {content}")
+async def stream_openrouter(prompt, deltas):
+    # Streams the completion, pushing each content delta onto the deltas queue, and returns the full text
+    async def create_stream():
+        chunks = []
+        try:
+            stream = await get_client().chat.completions.create(
+                model=OPENROUTER_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.15,
+                max_tokens=DIAGNOSIS_MAX_TOKENS,
+                response_format=JSON_RESPONSE_FORMAT,
+                stream=True
+            )
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    chunks.append(delta)
+                    deltas.put_nowait(delta)
+        except OpenAIError as e:
+            # Deltas already sent cannot be taken back, so only failures before the first one are retried
+            if chunks:
+                raise RuntimeError("OpenRouter stream interrupted") from e
+            raise
+        return "".join(chunks)
+
     try:
-        return json.loads(content)
-    except json.JSONDecodeError:
-        logger.error(f"Failed to parse JSON response: {content}")
+        content = await retrying(create_stream)
+    except OpenAIError as e:
+        if getattr(e, 'status_code', None) == 503:
+            logger.warning("OpenRouter 503 error in stream: %s", e)
+            raise Exception("Model temporarily unavailable. Please try again later.")
+        logger.error("OpenRouter API error in stream: %s", e)
+        raise
+    logger.debug("Raw OpenRouter streamed response: %s", content)
+    return content
+
+@lru_cache(maxsize=1)
+def get_embedder():
+    return SentenceTransformer(SEMANTIC_CACHE_MODEL)
+
+# diskcache is safe to share between worker processes, so every worker sees every stored diagnosis
+@lru_cache(maxsize=1)
+def get_semantic_cache():
+    return diskcache.Cache(os.path.join(CACHE_DIR, 'semantic_cache'))
+
+def normalize_case_value(value):
+    return " ".join(value.lower().split()) if value else ""
+
+def semantic_cache_partition(case):
+    # Categorical fields must match exactly; similarity is only used to compare free-text fields
+    return "|".join(normalize_case_value(getattr(case, field)) for field in CASE_EXACT_FIELDS)
+
+def embed_case(case):
+    # Each free-text field is embedded on its own, so a long shared field cannot mask a change in another
+    texts = {field: normalize_case_value(getattr(case, field)) for field in CASE_FREE_TEXT_FIELDS}
+    present = [field for field in CASE_FREE_TEXT_FIELDS if texts[field]]
+    vectors = get_embedder().encode([texts[field] for field in present], normalize_embeddings=True) if present else []
+    return {field: np.asarray(vector, dtype='float32') for field, vector in zip(present, vectors)}
+
+def case_similarity(vectors, cached_vectors):
+    # Fields must be filled in on both cases or neither; the score is the least similar field
+    if vectors.keys() != cached_vectors.keys():
+        return 0.0
+    return min((float(vectors[field] @ cached_vectors[field]) for field in vectors), default=1.0)
+
+def semantic_cache_lookup(case):
+    vectors = embed_case(case)
+    for cached_vectors, parsed_response in get_semantic_cache().get(semantic_cache_partition(case), []):
+        if case_similarity(vectors, cached_vectors) >= SEMANTIC_CACHE_THRESHOLD:
+            return vectors, parsed_response
+    return vectors, None
+
+def semantic_cache_store(case, vectors, parsed_response):
+    cache = get_semantic_cache()
+    key = semantic_cache_partition(case)
+    # transact() serializes the read-modify-write against other workers storing into the same partition
+    with cache.transact():
+        entries = cache.get(key, [])
+        entries.append((vectors, parsed_response))
+        cache.set(key, entries[-SEMANTIC_CACHE_MAX_ENTRIES:])
+
+# The cache is only an optimisation: if the embedder or diskcache fails, diagnosis carries on uncached
+async def semantic_cache_get(case):
+    # Embedding and cache I/O are blocking, so keep them off the event loop
+    try:
+        vectors, cached = await asyncio.to_thread(semantic_cache_lookup, case)
+    except Exception as e:
+        logger.warning("Semantic cache lookup failed, continuing without cache: %s", e)
+        return None, None
+    if cached is not None:
+        logger.info("Semantic cache hit for diagnosis case")
+    return vectors, cached
+
+async def semantic_cache_put(case, vectors, diagnosis):
+    # vectors is None when the lookup failed, so there is nothing to store against
+    if vectors is None:
+        return
+    try:
+        await asyncio.to_thread(semantic_cache_store, case, vectors, diagnosis)
+    except Exception as e:
+        logger.warning("Semantic cache store failed: %s", e)
+
+# Diagnosis lookups in progress, keyed by prompt hash. The check-and-insert below has no await
+# in between, so it is atomic on the event loop and needs no lock.
+inflight_diagnoses = {}
+
+async def query_openrouter_cached(case, deltas=None):
+    # With a deltas queue the upstream call is streamed into it; requests that join an in-flight
+    # lookup only receive the final result
+    key = hashlib.blake2b(create_prompt(case).encode(), digest_size=16).hexdigest()
+    task = inflight_diagnoses.get(key)
+    if task is None:
+        task = asyncio.ensure_future(lookup_diagnosis(case, deltas))
+        inflight_diagnoses[key] = task
+        task.add_done_callback(lambda _: inflight_diagnoses.pop(key, None))
+    else:
+        logger.info("Joining in-flight diagnosis request")
+    # Shielded so one client disconnecting does not cancel the lookup other requests are waiting on
+    return await asyncio.shield(task)
+
+async def lookup_diagnosis(case, deltas=None):
+    vectors, cached = await semantic_cache_get(case)
+    if cached is not None:
+        return cached
+    if deltas is None:
+        parsed_response = process_response(await query_openrouter(create_prompt(case)))
+    else:
+        parsed_response = extract_json(await stream_openrouter(create_prompt(case), deltas))
+    # Built once here and shared by the cache and the caller. Only complete diagnoses are cached,
+    # so an unusable completion is never replayed for similar cases.
+    diagnosis = build_diagnosis(parsed_response) if parsed_response else None
+    if diagnosis is not None:
+        await semantic_cache_put(case, vectors, diagnosis)
+    return diagnosis
+
+def find_json_block(content):
+    # Match the first '{' to its closing brace, ignoring braces inside strings. Only the four
+    # structural characters are visited, so the scan stays linear on any input.
+    start = content.find('{')
+    if start == -1:
+        return None
+    depth = 0
+    in_string = False
+    escaped_index = -1
+    for match in JSON_TOKEN_RE.finditer(content, start):
+        index = match.start()
+        if index == escaped_index:
+            continue
+        char = match.group()
+        if in_string:
+            if char == '\\':
+                escaped_index = index + 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return content[start:index + 1]
+    return None
+
+def extract_json(content):
+    # orjson handles the common well-formed case; the brace scan only runs when that fails
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        logger.error("Failed to parse JSON response: %s", content)
         # Attempt to extract JSON from code blocks or text
-        json_match = re.search(r'\{[\s\S]*\}', content)
-        if json_match:
+        json_block = find_json_block(content)
+        if json_block:
             try:
-                return json.loads(json_match.group(0))
-            except json.JSONDecodeError:
+                return orjson.loads(json_block)
+            except orjson.JSONDecodeError:
                 logger.error("Failed to parse extracted JSON")
         return None
 
+def process_response(response):
+    content = response.choices[0].message.content
+    logger.debug("Raw OpenRouter response: %s", content)
+    return extract_json(content)
+
 def get_diagnoses(response):
     if response and "conditions" in response:
         return [{"name": c["name"], "likelihood": c["likelihood"], "explanation": c.get("explanation", "")} for c in response["conditions"]]
@@ -77,76 +314,225 @@ def get_diagnoses(response):
 def get_highest_ranked_diagnosis(results):
     if not results:
         return "No diagnosis available"
-    top_diagnosis = max(results, key=lambda x: x["likelihood"])
+    top_three = heapq.nlargest(3, results, key=lambda x: x["likelihood"])
+    top_diagnosis = top_three[0]
     if len(results) >= 3:
-        top_three = sorted(results, key=lambda x: x["likelihood"], reverse=True)[:3]
         diagnoses_str = ', '.join(f"{d['name']} ({d['likelihood']}%)" for d in top_three)
         return f"Top 3 possible diagnoses: {diagnoses_str}"
     return f"{top_diagnosis['name']} ({top_diagnosis['likelihood']}%)"
 
+def build_diagnosis(openrouter_response):
+    # Returns None for any response missing the fields the UI needs, so callers treat it as a parse failure
+    try:
+        results = get_diagnoses(openrouter_response)
+        if not results:
+            return None
+        return {
+            "diagnosis": get_highest_ranked_diagnosis(results),
+            # Reuse the projected list so only the fields the UI reads are held and serialized
+            "conditions": results,
+            "urgent": openrouter_response["urgent"],
+            "consult": openrouter_response["consult"],
+            "homecare": openrouter_response["homecare"]
+        }
+    except (KeyError, TypeError, AttributeError) as e:
+        logger.error("Incomplete diagnosis response: %r", e)
+        return None
+
+def json_response(payload):
+    return Response(orjson.dumps(payload), mimetype="application/json")
+
+def asset_version(filename):
+    with open(os.path.join(app.root_path, filename), 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+
+# Content hashes for the query strings index.html references, so those URLs can be cached as immutable.
+# They are computed on first use and kept for the life of the process, so in production editing
+# scripts.js or styles.css requires a restart; otherwise new content would be served under the old
+# year-long immutable URL. The debug server skips versioning and caching altogether so edits show up on reload.
+@lru_cache(maxsize=1)
+def get_asset_versions():
+    return {filename: asset_version(filename) for filename in ('scripts.js', 'styles.css')}
+
+@lru_cache(maxsize=1)
+def versioned_index_html():
+    with open(os.path.join(app.root_path, 'index.html')) as f:
+        html = f.read()
+    for filename, version in get_asset_versions().items():
+        html = html.replace(f'"/{filename}"', f'"/{filename}?v={version}"')
+    return html, hashlib.blake2b(html.encode(), digest_size=8).hexdigest()
+
+async def send_versioned_asset(filename):
+    if app.debug:
+        return await send_from_directory(app.root_path, filename, cache_timeout=0)
+    if request.args.get('v') == get_asset_versions()[filename]:
+        response = await send_from_directory(app.root_path, filename, cache_timeout=VERSIONED_ASSET_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+    return await send_from_directory(app.root_path, filename, cache_timeout=STATIC_MAX_AGE)
+
 @app.route('/')
-def index():
-    return send_from_directory('.', 'index.html')
+async def index():
+    if app.debug:
+        return await send_from_directory(app.root_path, 'index.html', cache_timeout=0)
+    html, etag = versioned_index_html()
+    response = Response(html, mimetype='text/html')
+    response.cache_control.public = True
+    response.cache_control.max_age = STATIC_MAX_AGE
+    response.set_etag(etag)
+    return await response.make_conditional(request)
 
 @app.route('/scripts.js')
-def serve_scripts():
-    return send_from_directory('.', 'scripts.js')
+async def serve_scripts():
+    return await send_versioned_asset('scripts.js')
 
 @app.route('/styles.css')
-def serve_css():
-    return send_from_directory('.', 'styles.css')
+async def serve_css():
+    return await send_versioned_asset('styles.css')
 
 @app.route('/images/<path:filename>')
-def serve_image(filename):
-    return send_from_directory('images', filename)
+async def serve_image(filename):
+    return await send_from_directory('images', filename, cache_timeout=STATIC_MAX_AGE)
 
 @app.route('/diagnose', methods=['POST'])
-def diagnose():
+async def diagnose():
     try:
-        user_data = request.json
-        prompt = create_prompt(user_data)
-        results = []
+        case = msgspec.json.decode(await request.get_data(), type=CaseInput)
+        diagnosis = None
         queried_models = []
         skipped_models = []
         
         if OPENROUTER_API_KEY:
-            openrouter_response = process_response(query_openrouter(prompt))
-            if openrouter_response:
-                openrouter_diagnoses = get_diagnoses(openrouter_response)
-                results.extend(openrouter_diagnoses)
-                queried_models.append("OpenRouter")
-            else:
-                skipped_models.append("OpenRouter (API error)")
+            diagnosis = await query_openrouter_cached(case)
+            queried_models.append("OpenRouter")
         else:
             skipped_models.append("OpenRouter (no API key)")
         
         if not queried_models:
             return jsonify({"error": "No AI models were available to process your request. Please check API configurations.", "skipped_models": skipped_models}), 503
         
-        if not results:
+        if not diagnosis:
             return jsonify({"error": "Failed to parse AI response. Please try again."}), 500
 
-        final_diagnosis = get_highest_ranked_diagnosis(results)
         response = {
-            "diagnosis": final_diagnosis,
-            "conditions": openrouter_response["conditions"],
-            "urgent": openrouter_response["urgent"],
-            "consult": openrouter_response["consult"],
-            "homecare": openrouter_response["homecare"],
-            "disclaimer": "This is not veterinary advice. Please consult a licensed veterinarian for accurate diagnosis and treatment.",
+            **diagnosis,
+            "disclaimer": DISCLAIMER,
             "queried_models": queried_models,
             "skipped_models": skipped_models
         }
-        return jsonify(response)
+        return json_response(response)
+    except msgspec.DecodeError as e:
+        return jsonify({"error": f"Invalid case data: {str(e)}"}), 400
     except Exception as e:
-        logger.error(f"Error in diagnose endpoint: {str(e)}")
+        logger.error("Error in diagnose endpoint: %s", e)
         if "Model temporarily unavailable" in str(e):
             return jsonify({"error": "The AI model is currently unavailable due to high demand. Please try again later."}), 503
         return jsonify({"error": "An unexpected error occurred. Please try again."}), 500
 
-@lru_cache(maxsize=128)
-@retry(wait=wait_exponential(multiplier=1, min=2, max=5), stop=stop_after_attempt(2))
-def query_veterinary_details(diagnosis, species, breed):
+@app.route('/diagnose-batch', methods=['POST'])
+async def diagnose_batch():
+    try:
+        cases = msgspec.json.decode(await request.get_data(), type=list[CaseInput])
+        if not cases:
+            return jsonify({"error": "Request body must be a non-empty list of cases"}), 400
+        if len(cases) > BATCH_MAX_CASES:
+            return jsonify({"error": f"A batch may contain at most {BATCH_MAX_CASES} cases"}), 400
+        
+        if not OPENROUTER_API_KEY:
+            return jsonify({"error": "No AI models were available to process your request. Please check API configurations.", "skipped_models": ["OpenRouter (no API key)"]}), 503
+        
+        # Cases run concurrently; openrouter_semaphore keeps the upstream fan-out bounded
+        diagnoses = await asyncio.gather(
+            *[query_openrouter_cached(case) for case in cases],
+            return_exceptions=True
+        )
+        
+        results = []
+        for case_index, diagnosis in enumerate(diagnoses):
+            if isinstance(diagnosis, Exception):
+                logger.error("Error in diagnose-batch case %s: %s", case_index, diagnosis)
+                if "Model temporarily unavailable" in str(diagnosis):
+                    results.append({"case": case_index, "error": "The AI model is currently unavailable due to high demand. Please try again later."})
+                else:
+                    results.append({"case": case_index, "error": "An unexpected error occurred. Please try again."})
+                continue
+            if not diagnosis:
+                results.append({"case": case_index, "error": "Failed to parse AI response. Please try again."})
+                continue
+            results.append({"case": case_index, **diagnosis})
+        
+        return json_response({
+            "results": results,
+            "disclaimer": DISCLAIMER,
+            "queried_models": ["OpenRouter"],
+            "skipped_models": []
+        })
+    except msgspec.DecodeError as e:
+        return jsonify({"error": f"Invalid case data: {str(e)}"}), 400
+    except Exception as e:
+        logger.error("Error in diagnose-batch endpoint: %s", e)
+        return jsonify({"error": "An unexpected error occurred. Please try again."}), 500
+
+def sse_event(payload, event=None):
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {orjson.dumps(payload).decode()}\n\n"
+
+@app.route('/diagnose-stream', methods=['POST'])
+async def diagnose_stream():
+    try:
+        case = msgspec.json.decode(await request.get_data(), type=CaseInput)
+    except msgspec.DecodeError as e:
+        return jsonify({"error": f"Invalid case data: {str(e)}"}), 400
+    if not OPENROUTER_API_KEY:
+        return jsonify({"error": "No AI models were available to process your request. Please check API configurations.", "skipped_models": ["OpenRouter (no API key)"]}), 503
+    async def generate():
+        deltas = asyncio.Queue()
+        lookup = asyncio.ensure_future(query_openrouter_cached(case, deltas))
+        # A None sentinel after the lookup finishes ends the delta loop once every queued delta is sent
+        lookup.add_done_callback(lambda _: deltas.put_nowait(None))
+        try:
+            while (delta := await deltas.get()) is not None:
+                yield sse_event({"delta": delta})
+            diagnosis = lookup.result()
+            if not diagnosis:
+                yield sse_event({"error": "Failed to parse AI response. Please try again."}, event="error")
+                return
+            yield sse_event({
+                **diagnosis,
+                "disclaimer": DISCLAIMER,
+                "queried_models": ["OpenRouter"],
+                "skipped_models": []
+            }, event="done")
+        except Exception as e:
+            logger.error("Error in diagnose-stream endpoint: %s", e)
+            if "Model temporarily unavailable" in str(e):
+                yield sse_event({"error": "The AI model is currently unavailable due to high demand. Please try again later."}, event="error")
+            else:
+                yield sse_event({"error": "An unexpected error occurred. Please try again."}, event="error")
+        finally:
+            # Only stops this request waiting; the shielded lookup still finishes and fills the cache
+            lookup.cancel()
+
+    response = Response(generate(), mimetype="text/event-stream")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Shared by all workers, so a details lookup is only paid for once per (diagnosis, species, breed)
+@lru_cache(maxsize=1)
+def get_details_cache():
+    return diskcache.Cache(os.path.join(CACHE_DIR, 'veterinary_details'))
+
+async def get_veterinary_details(diagnosis, species, breed):
+    cache_key = f"{diagnosis}|{species}|{breed}".lower()
+    # diskcache does blocking SQLite I/O, so keep it off the event loop
+    if (details := await asyncio.to_thread(get_details_cache().get, cache_key)) is not None:
+        return details
+    details = await query_veterinary_details(diagnosis, species, breed)
+    if details:
+        await asyncio.to_thread(get_details_cache().set, cache_key, details, expire=DETAILS_CACHE_EXPIRE)
+    return details
+
+async def query_veterinary_details(diagnosis, species, breed):
     prompt = f"""Provide a JSON object with detailed veterinary information about "{diagnosis}" in {species} (breed: {breed}) using general veterinary knowledge. Include these fields:
     - Overview (str)
     - Symptoms (list or str)
@@ -159,36 +545,27 @@ def query_veterinary_details(diagnosis, species, breed):
     Focus on species-specific and breed-specific considerations where relevant.
     Return a valid JSON object, with no additional text or code blocks."""
     try:
-        response = client.chat.completions.create(
-            model=OPENROUTER_MODEL,
+        response = await retrying(lambda: get_client().chat.completions.create(
+            model=OPENROUTER_DETAILS_MODEL,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.15
-        )
+            temperature=0.15,
+            max_tokens=DETAILS_MAX_TOKENS,
+            response_format=JSON_RESPONSE_FORMAT
+        ))
         content = response.choices[0].message.content
-        logger.info(f"Raw OpenRouter veterinary details response: {content}")
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            logger.error(f"Failed to parse JSON response: {content}")
-            # Attempt to extract JSON from code blocks or text
-            json_match = re.search(r'\{[\s\S]*\}', content)
-            if json_match:
-                try:
-                    return json.loads(json_match.group(0))
-                except json.JSONDecodeError:
-                    logger.error("Failed to parse extracted JSON")
-            return None
+        logger.debug("Raw OpenRouter veterinary details response: %s", content)
+        return extract_json(content)
     except OpenAIError as e:
         if getattr(e, 'status_code', None) == 503:
-            logger.warning(f"OpenRouter 503 error in veterinary details: {str(e)}")
+            logger.warning("OpenRouter 503 error in veterinary details: %s", e)
             raise Exception("Model temporarily unavailable. Please try again later.")
-        logger.error(f"OpenRouter API error in veterinary details: {str(e)}")
+        logger.error("OpenRouter API error in veterinary details: %s", e)
         raise
 
 @app.route('/veterinary-details', methods=['POST'])
-def veterinary_details():
+async def veterinary_details():
     try:
-        data = request.json
+        data = await request.get_json()
         diagnosis = data.get("diagnosis")
         species = data.get("species", "Unknown")
         breed = data.get("breed", "Mixed")
@@ -200,7 +577,7 @@ def veterinary_details():
         skipped_models = []
         
         if OPENROUTER_API_KEY:
-            details = query_veterinary_details(diagnosis, species, breed)
+            details = await get_veterinary_details(diagnosis, species, breed)
             queried_models.append("OpenRouter")
         else:
             details = None
@@ -222,13 +599,13 @@ def veterinary_details():
         }
         return jsonify(response)
     except Exception as e:
-        logger.error(f"Error in veterinary-details endpoint: {str(e)}")
+        logger.error("Error in veterinary-details endpoint: %s", e)
         if "Model temporarily unavailable" in str(e):
             return jsonify({"error": "The AI model is currently unavailable due to high demand. Please try again later."}), 503
         return jsonify({"error": "An unexpected error occurred. Please try again."}), 500
 
 @app.route('/health')
-def health():
+async def health():
     missing_keys = []
     available_models = []
     
@@ -251,4 +628,7 @@ def health():
     })
 
 if __name__ == '__main__':
+    # Development server only. Production runs the ASGI app under several uvicorn workers so
+    # concurrent requests overlap their OpenRouter round-trips (see Dockerfile):
+    #   gunicorn -k uvicorn_worker.UvicornWorker -w $(nproc) -b 0.0.0.0:5000 app:app --timeout 120
     app.run(debug=True, port=5000)
\ No newline at end of file
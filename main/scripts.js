@@ -9,6 +9,7 @@ const consultResult = document.getElementById("consultResult");
 const homecareResult = document.getElementById("homecareResult");
 const veterinaryResult = document.getElementById("veterinaryResult");
 const editBtn = document.getElementById("editBtn");
+const streamProgress = document.getElementById("streamProgress");
 
 const dogBreeds = [
   "Mixed/Unknown", "Labrador Retriever", "Golden Retriever", "German Shepherd", "Bulldog", "Poodle", 
@@ -174,25 +175,65 @@ function handleSubmit() {
   setTimeout(showQuestion, 800);
 }
 
+function showStreamProgress(streamedText) {
+  // Surface condition names as soon as they appear in the partial JSON
+  const names = [...streamedText.matchAll(/"name"\s*:\s*"([^"]+)"/g)].map((match) => match[1]);
+  if (names.length) {
+    streamProgress.textContent = `Considering: ${names.join(", ")}`;
+  }
+}
+
+async function streamDiagnosis(payload) {
+  const response = await fetch("/diagnose-stream", {
+    method: "POST",
+    headers: { 
+      "Content-Type": "application/json"
+    },
+    body: JSON.stringify(payload),
+  });
+  if (!response.ok || !response.body) {
+    const errorData = await response.json();
+    throw new Error(errorData.error || "Diagnosis request failed");
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let streamedText = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = "message";
+      let data = "";
+      frame.split("\n").forEach((line) => {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      });
+      if (!data) continue;
+      const message = JSON.parse(data);
+      if (event === "done") return message;
+      if (event === "error") throw new Error(message.error);
+      streamedText += message.delta || "";
+      showStreamProgress(streamedText);
+    }
+  }
+  throw new Error("Diagnosis stream ended unexpectedly");
+}
+
 async function submitDiagnosis() {
   loading.style.display = "block";
   chatContainer.style.display = "none";
   inputArea.style.display = "none";
   results.style.display = "none";
+  streamProgress.textContent = "";
 
   try {
-    const diagnoseResponse = await fetch("/diagnose", {
-      method: "POST",
-      headers: { 
-        "Content-Type": "application/json"
-      },
-      body: JSON.stringify(userResponses),
-    });
-    const diagnoseData = await diagnoseResponse.json();
-
-    if (diagnoseData.error) {
-      throw new Error(diagnoseData.error);
-    }
+    const diagnoseData = await streamDiagnosis(userResponses);
 
     let topDiagnosis = diagnoseData.diagnosis;
     if (topDiagnosis.startsWith("Top 3 possible diagnoses:")) {
@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import json
+import types
+
+import diskcache
+import msgspec
+import numpy as np
+import pytest
+
+import app
+
+DIAGNOSIS = {
+    "conditions": [{"name": "Gastritis", "likelihood": 60, "explanation": "Dietary indiscretion"}],
+    "urgent": False,
+    "consult": "See a vet if vomiting continues.",
+    "homecare": "Withhold food for 12 hours."
+}
+
+BASE_CASE = app.CaseInput(
+    species="Dog",
+    breed="Beagle",
+    age="3 years",
+    sex="Male",
+    symptoms="Vomiting for 2 days, not eating"
+)
+
+
+class BagOfWordsEmbedder:
+    # Deterministic stand-in for the sentence-transformers model: identical text scores 1.0,
+    # texts sharing few words score low
+    def encode(self, texts, normalize_embeddings=False):
+        vectors = np.zeros((len(texts), 64), dtype='float32')
+        for row, text in enumerate(texts):
+            for word in text.split():
+                vectors[row, hashlib.blake2b(word.encode(), digest_size=1).digest()[0] % 64] += 1
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class ConstantEmbedder:
+    # Worst case for the cache: every text embeds identically
+    def encode(self, texts, normalize_embeddings=False):
+        return np.ones((len(texts), 4), dtype='float32') / 2
+
+
+def fake_completion(content):
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def semantic_cache(tmp_path, monkeypatch):
+    cache = diskcache.Cache(str(tmp_path))
+    monkeypatch.setattr(app, "get_semantic_cache", lambda: cache)
+    monkeypatch.setattr(app, "get_embedder", BagOfWordsEmbedder)
+    yield cache
+    cache.close()
+
+
+def store(case):
+    vectors, cached = app.semantic_cache_lookup(case)
+    assert cached is None
+    app.semantic_cache_store(case, vectors, app.build_diagnosis(DIAGNOSIS))
+
+
+def test_same_case_hits_despite_formatting(semantic_cache):
+    store(BASE_CASE)
+    resubmitted = msgspec.structs.replace(BASE_CASE, species="dog", symptoms="  vomiting for 2 days,   NOT eating ")
+    assert app.semantic_cache_lookup(resubmitted)[1] == app.build_diagnosis(DIAGNOSIS)
+
+
+@pytest.mark.parametrize("changes", [
+    {"species": "Cat"},
+    {"breed": "Poodle"},
+    {"age": "12 years"},
+    {"sex": "Female (Spayed)"}
+])
+def test_different_animal_misses_even_with_identical_embeddings(semantic_cache, monkeypatch, changes):
+    monkeypatch.setattr(app, "get_embedder", ConstantEmbedder)
+    store(BASE_CASE)
+    assert app.semantic_cache_lookup(msgspec.structs.replace(BASE_CASE, **changes))[1] is None
+
+
+def test_different_symptoms_miss(semantic_cache):
+    store(BASE_CASE)
+    changed = msgspec.structs.replace(BASE_CASE, symptoms="Vomiting, blood in stool")
+    assert app.semantic_cache_lookup(changed)[1] is None
+
+
+def test_added_free_text_field_misses(semantic_cache, monkeypatch):
+    monkeypatch.setattr(app, "get_embedder", ConstantEmbedder)
+    store(BASE_CASE)
+    changed = msgspec.structs.replace(BASE_CASE, medical_history="Ate a sock yesterday")
+    assert app.semantic_cache_lookup(changed)[1] is None
+
+
+def test_incomplete_response_is_not_cached(semantic_cache, monkeypatch, caplog):
+    async def query_openrouter(prompt):
+        return fake_completion(json.dumps({"conditions": [{"name": "Gastritis", "likelihood": 60}]}))
+
+    monkeypatch.setattr(app, "query_openrouter", query_openrouter)
+    assert asyncio.run(app.lookup_diagnosis(BASE_CASE)) is None
+    assert app.semantic_cache_lookup(BASE_CASE)[1] is None
+    # The response is validated once per lookup, so the failure is logged once
+    assert caplog.text.count("Incomplete diagnosis response") == 1
+
+
+def test_miss_caches_the_returned_diagnosis(semantic_cache, monkeypatch):
+    async def query_openrouter(prompt):
+        return fake_completion(json.dumps(DIAGNOSIS))
+
+    monkeypatch.setattr(app, "query_openrouter", query_openrouter)
+    diagnosis = asyncio.run(app.lookup_diagnosis(BASE_CASE))
+    assert diagnosis == app.build_diagnosis(DIAGNOSIS)
+    assert app.semantic_cache_lookup(BASE_CASE)[1] == diagnosis
+
+
+def unavailable():
+    raise OSError("model download failed or data/ is not writable")
+
+
+@pytest.mark.parametrize("broken", ["get_embedder", "get_semantic_cache"])
+def test_cache_failure_falls_through_to_openrouter(semantic_cache, monkeypatch, broken):
+    monkeypatch.setattr(app, broken, unavailable)
+    calls = []
+
+    async def query_openrouter(prompt):
+        calls.append(prompt)
+        return fake_completion(json.dumps(DIAGNOSIS))
+
+    monkeypatch.setattr(app, "query_openrouter", query_openrouter)
+    assert asyncio.run(app.lookup_diagnosis(BASE_CASE)) is not None
+    assert len(calls) == 1
+
+
+def test_versioned_assets_resolve_outside_the_app_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app.get_asset_versions.cache_clear()
+    app.versioned_index_html.cache_clear()
+    version = app.get_asset_versions()['scripts.js']
+    assert f'"/scripts.js?v={version}"' in app.versioned_index_html()[0]
+
+    async def fetch():
+        return await app.app.test_client().get(f'/scripts.js?v={version}')
+
+    response = asyncio.run(fetch())
+    assert response.status_code == 200
+    assert response.cache_control.immutable
+
+
+@pytest.mark.parametrize("content, expected", [
+    ('Here you go: {"consult": "use {brackets}"} thanks', '{"consult": "use {brackets}"}'),
+    (r'{"consult": "say \"stop}\" firmly"}', r'{"consult": "say \"stop}\" firmly"}'),
+    (r'{"homecare": "C:\\"} and more}', r'{"homecare": "C:\\"}'),
+    ('{"urgent": false}\nLet me know if you need {more} detail.', '{"urgent": false}'),
+    ('{"conditions": [{"name": "Gastritis"}', None),
+    ('No JSON here', None)
+])
+def test_find_json_block(content, expected):
+    block = app.find_json_block(content)
+    assert block == expected
+    if block is not None:
+        json.loads(block)